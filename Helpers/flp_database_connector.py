@@ -1,8 +1,81 @@
 import pandas as pd
 import pyodbc
-from typing import List, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 import datetime
+import csv
+import decimal
+import math
 import warnings
+import os
+import subprocess
+import tempfile
+import uuid
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+
+# Optional: arrow-odbc reads query results straight into Arrow buffers, which is much faster than pd.read_sql
+try:
+    import pyarrow as pa
+    from arrow_odbc import read_arrow_batches_from_odbc
+except ImportError:
+    read_arrow_batches_from_odbc = None
+
+# Optional: python-calamine is a much faster Excel reader than openpyxl
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+# Let the ODBC driver manager reuse connections to the same server
+pyodbc.pooling = True
+
+# Dataframes with at least this many rows (that aren't bulk loaded) are split across several connections
+PARALLEL_INSERT_THRESHOLD = 20_000
+# Overwrites larger than this disable nonclustered indexes during the load and rebuild them afterwards
+INDEX_REBUILD_THRESHOLD = 500_000
+# Uploads with at most this many values (rows x columns) are sent as a single multi-row INSERT
+SINGLE_INSERT_MAX_PARAMS = 1000
+# Rows sent per executemany round-trip for larger uploads
+EXECUTEMANY_BATCH_ROWS = 1000
+# Largest NVARCHAR(MAX)/VARBINARY(MAX) value (in bytes) arrow-odbc makes room for when reading. Longer values raise an error
+ARROW_MAX_TEXT_SIZE = 65_536
+ARROW_MAX_BINARY_SIZE = 65_536
+# Rows read from an Excel file and uploaded at a time
+EXCEL_BLOCK_ROWS = 10_000
+
+# Required columns and primary keys for tables in each standard schema (read-only)
+SCHEMA_STANDARDS = MappingProxyType({
+    "pricing": MappingProxyType({
+        "required_columns": (
+            "datetime_he", "pricing_location", "wholesale_market", "market_type",
+            "service", "price", "unit", "currency", "interval_width_s",
+            "update_timestamp", "update_user"
+        ),
+        "primary_key": ("datetime_he", "pricing_location", "wholesale_market", "market_type", "service")
+    }),
+    "ops": MappingProxyType({
+        "required_columns": (
+            "datetime_he", "asset", "name", "ops_type", "service",
+            "da_volume", "rt_volume", "unit", "interval_width_s",
+            "update_timestamp", "update_user"
+        ),
+        "primary_key": ("datetime_he", "asset", "name", "ops_type", "service")
+    }),
+    "revenue": MappingProxyType({
+        "required_columns": (
+            "datetime_he", "asset", "name", "ops_type", "service",
+            "da_revenue", "rt_revenue", "total_revenue", "currency",
+            "interval_width_s", "update_timestamp", "update_user"
+        ),
+        "primary_key": ("datetime_he", "asset", "name", "ops_type", "service")
+    })
+})
+
+# Audit columns that are filled in by the server via column defaults, with their (type, default) for new tables
+SERVER_DEFAULT_COLUMNS = MappingProxyType({
+    "update_timestamp": ("DATETIME", "SYSUTCDATETIME()"),
+    "update_user": ("NVARCHAR(100)", "SUSER_SNAME()")
+})
 
 class flp_database_connector:
     def __init__(self, username: str) -> None:
@@ -10,77 +83,143 @@ class flp_database_connector:
         self.quant_server_name = "azrsql002.database.windows.net"
         self.burapp_server_name = "BURAPP007"
         self.username = username
-        self.schema_standards = {
-                                    "pricing": {
-                                        "required_columns": [
-                                            "datetime_he", "pricing_location", "wholesale_market", "market_type",
-                                            "service", "price", "unit", "currency", "interval_width_s",
-                                            "update_timestamp", "update_user"
-                                        ],
-                                        "primary_key": ["datetime_he", "pricing_location", "wholesale_market", "market_type", "service"]
-                                    },
-                                    "ops": {
-                                        "required_columns": [
-                                            "datetime_he", "asset", "name", "ops_type", "service",
-                                            "da_volume", "rt_volume", "unit", "interval_width_s",
-                                            "update_timestamp", "update_user"
-                                        ],
-                                        "primary_key": ["datetime_he", "asset", "name", "ops_type", "service"]
-                                    },
-                                    "revenue": {
-                                        "required_columns": [
-                                            "datetime_he", "asset", "name", "ops_type", "service",
-                                            "da_revenue", "rt_revenue", "total_revenue", "currency",
-                                            "interval_width_s", "update_timestamp", "update_user"
-                                        ],
-                                        "primary_key": ["datetime_he", "asset", "name", "ops_type", "service"]
-                                    }
-                                }
+        self.schema_standards = SCHEMA_STANDARDS
+        self._quant_conn_str = None
+        self._burapp_conn_strs: Dict[str, str] = {}
+        self._quant_conn = None
+        # Insert cursors on the cached connection, keyed by (table, columns), so their prepared INSERTs are reused
+        self._insert_cache: Dict[Tuple[str, Tuple[str, ...]], pyodbc.Cursor] = {}
+
+    def __enter__(self) -> "flp_database_connector":
+        return self
 
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Close the cached Quant connection, if one is open.
+        """
+        if self._quant_conn is not None:
+            self._quant_conn.close()
+            self._quant_conn = None
+        self._insert_cache.clear()
 
     # --- Functions to connect to databses ---
+    def quant_connection_string(self) -> str:
+        """
+        Full ODBC connection string for the Quant SQL Server, using ActiveDirectoryIntegrated auth.
+        Built on first use and cached.
+        """
+        if self._quant_conn_str is None:
+            self._quant_conn_str = (
+                f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+                f"SERVER=tcp:{self.quant_server_name},1433;"
+                f"DATABASE={self.quant_db_name};"
+                f"Uid={self.username};"
+                f"Encrypt=yes;"
+                f"TrustServerCertificate=no;"
+                f"Connection Timeout=30;"
+                f"Authentication=ActiveDirectoryIntegrated"
+            )
+        return self._quant_conn_str
+
     def connect_to_quant_db(self) -> pyodbc.Connection:
         """
         Connect to Quant SQL Server using a full connection string with ActiveDirectoryIntegrated auth.
         """
-        conn_str = (
-            f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-            f"SERVER=tcp:{self.quant_server_name},1433;"
-            f"DATABASE={self.quant_db_name};"
-            f"Uid={self.username};"
-            f"Encrypt=yes;"
-            f"TrustServerCertificate=no;"
-            f"Connection Timeout=30;"
-            f"Authentication=ActiveDirectoryIntegrated"
-        )
-        return pyodbc.connect(conn_str)
+        return pyodbc.connect(self.quant_connection_string())
+
+    def _get_quant_conn(self) -> pyodbc.Connection:
+        """
+        Return the cached Quant connection, opening a new one if there isn't one yet or it has dropped.
+        """
+        if self._quant_conn is not None:
+            try:
+                self._quant_conn.execute("SELECT 1").fetchone()
+                return self._quant_conn
+            except pyodbc.Error:
+                self._quant_conn = None
+                self._insert_cache.clear()
+        self._quant_conn = self.connect_to_quant_db()
+        return self._quant_conn
+
+    def _get_insert_cursor(self, conn: pyodbc.Connection, table_name: str, columns: List[str]) -> pyodbc.Cursor:
+        """
+        Return a cursor on conn (the cached Quant connection) for inserting these columns into table_name.
+        Reusing the cursor for executemany uploads with the same shape lets pyodbc skip re-preparing the INSERT statement.
+        """
+        key = (table_name, tuple(columns))
+        if key not in self._insert_cache:
+            cursor = conn.cursor()
+            cursor.fast_executemany = True
+            self._insert_cache[key] = cursor
+        return self._insert_cache[key]
     
+    def burapp_connection_string(self, database: str) -> str:
+        """
+        Full ODBC connection string for a database on the BURAPP SQL Server, using Windows authentication.
+        Built on first use for each database and cached.
+        """
+        # password = getpass.getpass("Enter your Windows password: ")
+        if database not in self._burapp_conn_strs:
+            self._burapp_conn_strs[database] = (
+                f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+                f"SERVER=tcp:{self.burapp_server_name},1433;"
+                f"DATABASE={database};"
+                f"Encrypt=yes;"
+                f"TrustServerCertificate=yes;"
+                f"Connection Timeout=30;"
+                f"Authentication=ActiveDirectoryIntegrated"
+            )
+        return self._burapp_conn_strs[database]
+
     def connect_to_burapp_db(self, database: str) -> pyodbc.Connection:
         """
         Connect to BURAPP SQL Server using a Windows authentication.
         """
-        # password = getpass.getpass("Enter your Windows password: ")
-        conn_str = (
-            f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-            f"SERVER=tcp:{self.burapp_server_name},1433;"
-            f"DATABASE={database};"
-            f"Encrypt=yes;"
-            f"TrustServerCertificate=yes;"
-            f"Connection Timeout=30;"
-            f"Authentication=ActiveDirectoryIntegrated"
-        )
-        return pyodbc.connect(conn_str)
+        return pyodbc.connect(self.burapp_connection_string(database))
 
     # --- Database read functions ---
-    def read_from_db(self, server: str, database: str, query: str) -> pd.DataFrame:
+    def read_from_db(self, server: str, database: str, query: str, use_arrow: bool = False) -> pd.DataFrame:
+        """
+        Run a query on the Quant or BURAPP SQL server and return the results as a dataframe.
+
+        Parameters:
+            server: str              -- "DataQuant01" or "BURAPP007"
+            database: str            -- database to query on the BURAPP server (ignored for DataQuant01)
+            query: str               -- SQL query to run
+            use_arrow: bool = False  -- if true and arrow-odbc is installed, fetch the results straight into Arrow. Faster for
+                                        large results, but arrow-odbc opens its own connection for every read, so it
+                                        pays a full login instead of reusing the cached Quant connection
+        """
         if server == self.quant_db_name:
-            conn = self.connect_to_quant_db()
+            conn_str = self.quant_connection_string()
         elif server == self.burapp_server_name:
-            conn = self.connect_to_burapp_db(database)
+            conn_str = self.burapp_connection_string(database)
         else:
             raise ValueError(f"Unknown server: {server}. Expected value is either BURAPP007 or DataQuant01")
 
-        df = pd.read_sql(query, conn)
+        # Fetch columnar batches straight into Arrow if asked to. (MAX) columns have no size to allocate buffers from,
+        # so they need explicit limits
+        if use_arrow and read_arrow_batches_from_odbc is not None:
+            reader = read_arrow_batches_from_odbc(
+                query=query,
+                connection_string=conn_str,
+                batch_size=65536,
+                max_text_size=ARROW_MAX_TEXT_SIZE,
+                max_binary_size=ARROW_MAX_BINARY_SIZE
+            )
+            table = pa.Table.from_batches(list(reader), schema=reader.schema)
+            # Return the same dtypes as fetch_dataframe: numpy-backed columns, with DECIMAL/NUMERIC as floats
+            schema = pa.schema([
+                field.with_type(pa.float64()) if pa.types.is_decimal(field.type) else field for field in table.schema])
+            return table.cast(schema).to_pandas()
+
+        if server == self.quant_db_name:
+            return self.fetch_dataframe(self._get_quant_conn(), query)
+        conn = self.connect_to_burapp_db(database)
+        df = self.fetch_dataframe(conn, query)
         conn.close()
         return df
 
@@ -100,48 +239,68 @@ class flp_database_connector:
         Parameters:
             table_name: str              -- e.g., "dbo.MyTable"
             excel_file: str              -- path to Excel file
-            mode: str = "append"         -- 'append' or 'overwrite'
+            mode: str = "append"         -- 'append', 'overwrite', or 'upsert'
             skip_prompt: bool = False    -- if true, skip user prompt asking for confirmation of overwriting or creating a new table
             check_standards: bool = True -- if true, check that column names match expectation for schema & create primary key if creating new table
         """
-        # Step 1: Load Excel
-        df = pd.read_excel(excel_file)
-
-        # Step 2: Upload data
-        self.upload_data_to_quant_db(table_name, df, mode, skip_prompt, check_standards)
+        # Read the file in blocks of rows so the whole workbook is never held in memory. A first pass over the sheet
+        # works out the column types and text widths, then every block is cast to those types and inserted as one upload
+        schema_df, n_rows = self.excel_schema(excel_file)
+        dtypes = schema_df.dtypes.to_dict()
+        blocks = (block.astype(dtypes) for block in self.iter_excel_blocks(excel_file))
+        self._upload_to_quant_db(table_name, schema_df, n_rows, blocks, mode, skip_prompt, check_standards)
 
     def upload_data_to_quant_db(self,
         table_name: str,
         df: pd.DataFrame,
         mode: str = "append",
         skip_prompt: bool = False,
-        check_standards: bool = True
+        check_standards: bool = True,
+        use_bulk: bool = False,
+        max_workers: int = 1
     ) -> None:
         """
         Upload data from a dataframe to the Quant SQL server.
-        If the table already exists, will either append or overwrite data in the table.
+        If the table already exists, will either append, overwrite, or upsert data in the table.
+        Upserting updates rows whose primary key is already in the table and inserts the rest.
         If the table doesn't exist, will create it.
+        update_timestamp and update_user are filled in by the server (as UTC time and SQL login) if df doesn't have them.
 
         Parameters:
             table_name: str              -- e.g., "dbo.MyTable"
             df: dataframe                -- Pandas dataframe containing the data to be uploaded
-            mode: str = "append"         -- 'append', 'overwrite', or 'create
+            mode: str = "append"         -- 'append', 'overwrite', 'upsert', or 'create'
             skip_prompt: bool = False    -- if true, skip user prompt asking for confirmation of creating or overwriting a table
             check_standards: bool = True -- if true, check that column names match expectation for schema & create primary key if creating new table
+            use_bulk: bool = False       -- if true, load with bcp instead of parameterized inserts. bcp commits every 50,000 rows, so a failed bulk load can leave some rows behind
+            max_workers: int = 1         -- if more than 1, insert dataframes with 20,000+ rows over this many connections in parallel. Each connection logs in and commits its own rows, so the upload is no longer a single transaction
         """
-        # Step 1: If data doesn't already have update_timestamp and update_user columns, add them
-        if 'update_timestamp' not in df.columns:
-            df['update_timestamp'] = datetime.datetime.now()
-        if 'update_user' not in df.columns:
-            username = self.username.split('\\')[-1]  # Remove domain if present
-            df['update_user'] = username
+        self._upload_to_quant_db(table_name, df, len(df), [df], mode, skip_prompt, check_standards, use_bulk, max_workers)
 
-        # Step 2: Validate schema & column standards
+    def _upload_to_quant_db(self,
+        table_name: str,
+        df: pd.DataFrame,
+        n_rows: int,
+        blocks: Iterable[pd.DataFrame],
+        mode: str,
+        skip_prompt: bool,
+        check_standards: bool,
+        use_bulk: bool = False,
+        max_workers: int = 1
+    ) -> None:
+        """
+        Upload n_rows rows, given as dataframes in blocks, to the Quant SQL server (see upload_data_to_quant_db).
+        df must have the same columns and dtypes as the blocks and be representative of all their values, as it's used
+        to validate the columns and to create the table. Unless bcp or parallel inserts are used, every block is
+        inserted on one connection and committed together.
+        """
+        # Step 1: Validate schema & column standards. update_timestamp and update_user can be left out; the server fills them in
         schema, _ = table_name.split(".")
         if check_standards:
-            if schema in ["pricing", "ops", "revenue"]:
+            if schema in self.schema_standards:
                 required = self.schema_standards[schema]["required_columns"]
-                missing = [col for col in required if col not in df.columns]
+                df_columns = frozenset(df.columns)
+                missing = [col for col in required if col not in df_columns and col not in SERVER_DEFAULT_COLUMNS]
                 if missing:
                     raise ValueError(f"Missing required columns for schema '{schema}': {missing}")
                 primary_key_columns = self.schema_standards[schema]["primary_key"]
@@ -153,61 +312,337 @@ class flp_database_connector:
         else:
              primary_key_columns = None
         
-        # Step 3: Connect to SQL
-        conn = self.connect_to_quant_db()
+        # Step 2: Connect to SQL
+        conn = self._get_quant_conn()
         cursor = conn.cursor()
-
-        # Step 4: Get schema & validate column names if table exists. If it doesn't, create a new table
-        sql_columns = self.get_sql_columns(cursor, table_name)
-        if len(sql_columns) < 1:
-            if mode=="create" or skip_prompt or input(f"Table '{table_name}' does not exist. Create it? (y/n): ").lower() == 'y':
-                    self.create_table_from_dataframe(cursor, table_name, df, primary_key_columns=primary_key_columns)
+        disabled_indexes = []
+        staging_table = None
+        table_created = False
+        refresh_columns = []
+        audit_values = {}
+        try:
+            # Step 3: Get schema & validate column names if table exists. If it doesn't, create a new table
+            if not self.table_exists(cursor, table_name):
+                if mode=="create" or skip_prompt or input(f"Table '{table_name}' does not exist. Create it? (y/n): ").lower() == 'y':
+                        self.create_table_from_dataframe(cursor, table_name, df, primary_key_columns=primary_key_columns)
+                        conn.commit()
+                        table_created = True
+                        table_columns = df.columns.tolist() + [col for col in SERVER_DEFAULT_COLUMNS if col not in df.columns]
+                else:
+                    raise ValueError("Table does not exist and creation was cancelled by user.")
             else:
-                raise ValueError("Table does not exist and creation was cancelled by user.")
-        else:
-            self.validate_columns(df.columns.tolist(), sql_columns)
+                sql_columns = self.get_sql_columns(cursor, table_name)
+                defaulted = {col[0] for col in sql_columns if col[2] is not None}
+                # Older tables may not have server defaults for the audit columns, so fill those in here instead.
+                # Their history uses local time and the bare username, so keep to that rather than the defaults' values
+                if 'update_timestamp' not in df.columns and 'update_timestamp' not in defaulted:
+                    audit_values['update_timestamp'] = datetime.datetime.now()
+                if 'update_user' not in df.columns and 'update_user' not in defaulted:
+                    audit_values['update_user'] = self.username.split('\\')[-1]  # Remove domain if present
+                if audit_values:
+                    df = df.assign(**audit_values)
+                table_columns = [col[0] for col in sql_columns]
+                refresh_columns = [col for col in SERVER_DEFAULT_COLUMNS if col in defaulted and col not in df.columns]
+                # Columns the data leaves out are fine as long as the server has a default for them
+                self.validate_columns(
+                    df.columns.tolist(), [col for col in sql_columns if col[0] in df.columns or col[0] not in defaulted])
 
-        # Step 5: Clear table if mode is overwrite
-        if mode.lower() == "overwrite" and (skip_prompt or input(f"Confirm overwriting all rows in '{table_name}'? (y/n): ").lower() == 'y'):
-            cursor.execute(f"DELETE FROM {table_name}")
-            print(f"All previous data in {table_name} cleared...")
-            conn.commit()
+            # Step 4: Clear table if mode is overwrite. For large loads, also disable nonclustered indexes so they're
+            # rebuilt once at the end instead of being maintained row by row
+            if mode.lower() == "overwrite" and (skip_prompt or input(f"Confirm overwriting all rows in '{table_name}'? (y/n): ").lower() == 'y'):
+                try:
+                    cursor.execute(f"TRUNCATE TABLE {table_name}")
+                except pyodbc.Error:
+                    # TRUNCATE needs ALTER permission and isn't allowed on tables referenced by a foreign key
+                    cursor.execute(f"DELETE FROM {table_name}")
+                print(f"All previous data in {table_name} cleared...")
+                if n_rows > INDEX_REBUILD_THRESHOLD:
+                    disabled_indexes = self.disable_nonclustered_indexes(cursor, table_name)
+                # The truncate is committed with the new rows, so a failed upload leaves the old data in place. bcp and
+                # parallel inserts load on other connections, which would be blocked by the uncommitted truncate
+                if use_bulk or max_workers > 1:
+                    conn.commit()
 
-        # Step 6: Insert rows into SQL table
-        placeholders = ", ".join(["?"] * len(df.columns))
-        colnames = ", ".join(df.columns)
-        sql = f"INSERT INTO {table_name} ({colnames}) VALUES ({placeholders})"
-        data = [tuple(None if pd.isna(val) else val for val in row) for _, row in df.iterrows()]
+            # Step 5: Insert rows into SQL table. Upserts load into a staging table first and merge it in afterwards
+            # (unless the table was just created, in which case there's nothing to merge with)
+            if mode.lower() == "upsert" and not table_created:
+                key_columns = self.get_primary_key_columns(cursor, table_name)
+                if not key_columns:
+                    raise ValueError(f"Table '{table_name}' has no primary key to upsert on.")
+                staging_table = self.create_staging_table(cursor, table_name, df.columns.tolist())
+                conn.commit()
+            load_table = staging_table or table_name
 
-        cursor.fast_executemany = True
-        cursor.executemany(sql, data)
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print(f"Upload complete: {len(df)} rows {'appended to' if mode == 'append' else 'written to'} {table_name}")
+            for block in blocks:
+                if audit_values:
+                    block = block.assign(**audit_values)
+                if use_bulk:
+                    # bcp loads every column by position; columns left empty are filled in with their defaults
+                    self.bulk_insert_dataframe(load_table, block if staging_table else block.reindex(columns=table_columns))
+                elif max_workers > 1 and len(block) >= PARALLEL_INSERT_THRESHOLD:
+                    self.parallel_insert_dataframe(load_table, block, max_workers)
+                else:
+                    # Only executemany inserts reuse a prepared INSERT. Staging tables are single use, and small blocks
+                    # are sent as one multi-row INSERT that would replace the cursor's prepared statement
+                    if staging_table or len(block) * len(block.columns) <= SINGLE_INSERT_MAX_PARAMS:
+                        insert_cursor = cursor
+                    else:
+                        insert_cursor = self._get_insert_cursor(conn, table_name, block.columns)
+                    self.insert_dataframe(insert_cursor, load_table, block)
+            conn.commit()
+
+            if staging_table:
+                self.merge_staging_table(cursor, staging_table, table_name, df.columns.tolist(), key_columns, refresh_columns)
+                conn.commit()
+        except Exception:
+            # Don't leave a half-finished upload pending on the cached connection
+            conn.rollback()
+            # Unless it was committed early for bcp or parallel inserts, the rollback also re-enables the indexes
+            if not (use_bulk or max_workers > 1):
+                disabled_indexes = []
+            raise
+        finally:
+            # Cleanup failures are only warned about, so they don't hide the error that stopped the upload
+            if disabled_indexes:
+                try:
+                    self.rebuild_indexes(cursor, table_name, disabled_indexes)
+                    conn.commit()
+                except Exception as e:
+                    warnings.warn(f"Failed to rebuild indexes {disabled_indexes} on {table_name}; rebuild them manually: {e}")
+            if staging_table:
+                try:
+                    cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+                    conn.commit()
+                except Exception as e:
+                    warnings.warn(f"Failed to drop staging table {staging_table}: {e}")
+            cursor.close()
+        action = {"append": "appended to", "upsert": "merged into"}.get(mode.lower(), "written to")
+        print(f"Upload complete: {n_rows} rows {action} {table_name}")
 
     def delete_table_from_quant_db(self, table_name: str) -> None:
-        conn = self.connect_to_quant_db()
+        conn = self._get_quant_conn()
         cursor = conn.cursor()
         try:
-            cursor.execute(f"DROP TABLE {table_name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
             conn.commit()
-            print(f"Table {table_name} deleted successfully.")
-        except Exception as e:
-            print(f"Failed to delete table {table_name}: {e}")
+        except Exception:
+            conn.rollback()
+            raise
         finally:
             cursor.close()
-            conn.close()
+
+        # Statements prepared against the dropped table can't be reused
+        for key in [key for key in self._insert_cache if key[0] == table_name]:
+            self._insert_cache.pop(key).close()
+        print(f"Table {table_name} deleted successfully.")
         
     # Helper functions
-    def get_sql_columns(self, cursor: pyodbc.Cursor, table_name: str) -> List[Tuple[str, str]]:
+    def fetch_dataframe(self, conn: pyodbc.Connection, query: str, batch_rows: int = 10000) -> pd.DataFrame:
+        """
+        Run a query on a pyodbc connection and build a dataframe from the results.
+        Rows are fetched in batches and collected column by column, so the dataframe is built without a row-to-column
+        transpose. DECIMAL/NUMERIC columns are converted to floats, as pd.read_sql does.
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query)
+            description = cursor.description
+            columns = [col[0] for col in description]
+            values = [[] for _ in columns]
+            while True:
+                rows = cursor.fetchmany(batch_rows)
+                if not rows:
+                    break
+                for column_values, batch_values in zip(values, zip(*rows)):
+                    column_values.extend(batch_values)
+        finally:
+            cursor.close()
+
+        for i, col in enumerate(description):
+            if col[1] is decimal.Decimal:
+                values[i] = [None if value is None else float(value) for value in values[i]]
+
+        # Build from positions rather than names so duplicate column names in the query are kept
+        df = pd.DataFrame(dict(enumerate(values)))
+        df.columns = columns
+        return df
+
+    def iter_excel_blocks(self, excel_file: str, block_rows: int = EXCEL_BLOCK_ROWS) -> Iterator[pd.DataFrame]:
+        """
+        Read the first sheet of an Excel file, yielding its rows as dataframes of up to block_rows rows.
+        The first row is used as the column names. Each block's dtypes are inferred from its own rows only; see
+        excel_schema for the dtypes of the whole sheet.
+        """
+        rows = self.iter_excel_rows(excel_file)
+        columns = self.excel_column_names(next(rows, []))
+        block = []
+        for row in rows:
+            block.append(row)
+            if len(block) == block_rows:
+                yield pd.DataFrame(block, columns=columns)
+                block = []
+        if block:
+            yield pd.DataFrame(block, columns=columns)
+
+    def excel_schema(self, excel_file: str) -> Tuple[pd.DataFrame, int]:
+        """
+        Scan the whole first sheet of an Excel file and return a small dataframe with the columns and dtypes that
+        pd.read_excel would give the full sheet, along with the sheet's number of rows.
+        For each column, the dataframe holds one value of each type seen, the longest value, and a null if there were
+        any: that's all pandas' type inference and nvarchar_type look at, so it can stand in for the full data when
+        creating a table.
+        """
+        rows = self.iter_excel_rows(excel_file)
+        columns = self.excel_column_names(next(rows, []))
+        samples = [{} for _ in columns]
+        longest = [None] * len(columns)
+        has_null = [False] * len(columns)
+        n_rows = 0
+        for row in rows:
+            n_rows += 1
+            for i in range(len(columns)):
+                value = row[i] if i < len(row) else None
+                if value is None:
+                    has_null[i] = True
+                    continue
+                samples[i].setdefault(type(value), value)
+                if longest[i] is None or len(str(value)) > len(str(longest[i])):
+                    longest[i] = value
+
+        values = [
+            list(sample.values()) + ([longest[i]] if longest[i] is not None else []) + ([None] if has_null[i] else [])
+            for i, sample in enumerate(samples)]
+        # Repeat each column's values to a common length, which doesn't change the types present
+        n_sample = max([len(column_values) for column_values in values], default=0)
+        values = [(column_values * n_sample)[:n_sample] for column_values in values]
+        return pd.DataFrame(list(zip(*values)), columns=columns), n_rows
+
+    def excel_column_names(self, header: List[Any]) -> List[Any]:
+        """
+        Name columns from an Excel header row the way pd.read_excel does: blank headers become "Unnamed: <position>",
+        and repeats of a name get ".1", ".2", ... suffixes.
+        """
+        names = [f"Unnamed: {i}" if name is None else name for i, name in enumerate(header)]
+        counts: Dict[Any, int] = {}
+        for i, name in enumerate(names):
+            count = counts.get(name, 0)
+            while count > 0:
+                counts[name] = count + 1
+                name = f"{name}.{count}"
+                count = counts.get(name, 0)
+            names[i] = name
+            counts[name] = count + 1
+        return names
+
+    def iter_excel_rows(self, excel_file: str) -> Iterator[List[Any]]:
+        """
+        Yield the rows of the first sheet of an Excel file as lists of values normalized by convert_excel_cell, skipping
+        empty rows. Uses python-calamine if installed, otherwise openpyxl in read-only mode.
+        """
+        rows, workbook = None, None
+        if CalamineWorkbook is not None:
+            try:
+                sheet = CalamineWorkbook.from_path(excel_file).get_sheet_by_index(0)
+            except Exception:
+                sheet = None  # Fall back to openpyxl for files calamine can't read
+            if sheet is not None:
+                # calamine's rows start at the first used column, so pad them back out to column A
+                padding = [None] * (sheet.start[1] if sheet.start else 0)
+                rows = (padding + row for row in sheet.iter_rows())
+        if rows is None:
+            from openpyxl import load_workbook
+            workbook = load_workbook(excel_file, read_only=True, data_only=True)
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+
+        try:
+            for row in rows:
+                values = [self.convert_excel_cell(value) for value in row]
+                if any(value is not None for value in values):
+                    yield values
+        finally:
+            if workbook is not None:
+                workbook.close()
+
+    def convert_excel_cell(self, value: Any) -> Any:
+        """
+        Normalize a raw Excel cell value the way pd.read_excel does: empty cells become None, whole-number floats
+        become ints, and dates become datetimes.
+        """
+        if value == "":
+            return None
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+            return datetime.datetime(value.year, value.month, value.day)
+        return value
+
+    def table_exists(self, cursor: pyodbc.Cursor, table_name: str) -> bool:
+        """
+        Check whether a table exists using OBJECT_ID, which is a cheap metadata lookup compared to INFORMATION_SCHEMA.
+        """
+        cursor.execute("SELECT OBJECT_ID(?, 'U')", table_name)
+        return cursor.fetchval() is not None
+
+    def get_primary_key_columns(self, cursor: pyodbc.Cursor, table_name: str) -> List[str]:
+        """
+        Pull the primary key column names of an existing SQL table, in key order.
+        Returns an empty list if the table has no primary key.
+        """
+        query = """
+            SELECT c.name
+            FROM sys.indexes i
+            JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+            JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+            WHERE i.object_id = OBJECT_ID(?) AND i.is_primary_key = 1
+            ORDER BY ic.key_ordinal
+        """
+        cursor.execute(query, table_name)
+        return [row[0] for row in cursor.fetchall()]
+
+    def create_staging_table(self, cursor: pyodbc.Cursor, table_name: str, columns: List[str]) -> str:
+        """
+        Create an empty global temp table with the given columns of table_name (same types, no indexes or constraints).
+        It's a global (##) temp table so bcp and parallel insert connections can load into it too.
+        Returns the staging table's name; the caller is responsible for dropping it.
+        """
+        staging_table = f"##staging_{table_name.replace('.', '_')}_{uuid.uuid4().hex[:8]}"
+        colnames = ", ".join([f"[{col}]" for col in columns])
+        cursor.execute(f"SELECT TOP 0 {colnames} INTO {staging_table} FROM {table_name}")
+        return staging_table
+
+    def merge_staging_table(self,
+        cursor: pyodbc.Cursor,
+        staging_table: str,
+        table_name: str,
+        columns: List[str],
+        key_columns: List[str],
+        default_columns: List[str] = ()
+    ) -> None:
+        """
+        MERGE a staging table into table_name in one set-based statement: rows whose key columns match an existing row
+        update it, and all other rows are inserted. Updated rows also reset default_columns to their column defaults.
         """
-        Pull column names and types from an existing SQL table using INFORMATION_SCHEMA.
-        Returns a list of (column_name, data_type).
+        on_clause = " AND ".join([f"tgt.[{col}] = src.[{col}]" for col in key_columns])
+        update_clause = ", ".join(
+            [f"tgt.[{col}] = src.[{col}]" for col in columns if col not in key_columns] +
+            [f"[{col}] = DEFAULT" for col in default_columns])
+        colnames = ", ".join([f"[{col}]" for col in columns])
+        src_colnames = ", ".join([f"src.[{col}]" for col in columns])
+
+        merge_stmt = f"MERGE INTO {table_name} WITH (HOLDLOCK) AS tgt USING {staging_table} AS src ON {on_clause} "
+        if update_clause:
+            merge_stmt += f"WHEN MATCHED THEN UPDATE SET {update_clause} "
+        merge_stmt += f"WHEN NOT MATCHED THEN INSERT ({colnames}) VALUES ({src_colnames});"
+        cursor.execute(merge_stmt)
+
+    def get_sql_columns(self, cursor: pyodbc.Cursor, table_name: str) -> List[Tuple[str, str, str]]:
+        """
+        Pull column names, types, and defaults from an existing SQL table using INFORMATION_SCHEMA.
+        Returns a list of (column_name, data_type, column_default), where column_default is None if there isn't one.
         """
         schema, table = table_name.split(".")
         query = """
-            SELECT COLUMN_NAME, DATA_TYPE
+            SELECT COLUMN_NAME, DATA_TYPE, COLUMN_DEFAULT
             FROM INFORMATION_SCHEMA.COLUMNS
             WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ?
             ORDER BY ORDINAL_POSITION
@@ -216,38 +651,210 @@ class flp_database_connector:
         return cursor.fetchall()
 
 
-    def validate_columns(self, excel_columns: List[str], sql_columns: List[Tuple[str, str]]) -> None:
+    def insert_dataframe(self, cursor: pyodbc.Cursor, table_name: str, df: pd.DataFrame) -> None:
+        """
+        Insert the rows of a dataframe into an existing SQL table using parameterized inserts.
+        Does not commit; the caller is responsible for committing the transaction.
+        """
+        placeholders = ", ".join(["?"] * len(df.columns))
+        colnames = ", ".join(df.columns)
+        sql = f"INSERT INTO {table_name} ({colnames}) VALUES ({placeholders})"
+        data = self.dataframe_to_rows(df)
+        if not data:
+            return
+
+        # Small uploads go in as a single multi-row INSERT: one round-trip and no separate prepare step
+        if len(data) * len(df.columns) <= SINGLE_INSERT_MAX_PARAMS:
+            values_clause = ", ".join([f"({placeholders})"] * len(data))
+            cursor.execute(f"INSERT INTO {table_name} ({colnames}) VALUES {values_clause}", [val for row in data for val in row])
+            return
+
+        # fast_executemany sends each batch as one array of parameters, so the 2100 parameter limit doesn't apply.
+        # Batching by rows just bounds how much the driver buffers per round-trip
+        cursor.fast_executemany = True
+        for i in range(0, len(data), EXECUTEMANY_BATCH_ROWS):
+            cursor.executemany(sql, data[i:i + EXECUTEMANY_BATCH_ROWS])
+
+    def dataframe_to_rows(self, df: pd.DataFrame) -> List[tuple]:
+        """
+        Convert a dataframe to a list of row tuples for pyodbc, with every null (NaN, NaT, None, pd.NA) as None so it's
+        inserted as NULL. Each column is converted and null-masked in one vectorized pass, so no per-cell checks are needed.
+        Tz-aware datetimes are sent as ISO 8601 strings with their UTC offset (see datetimeoffset_strings).
+        """
+        columns = []
+        for i, dtype in enumerate(df.dtypes):
+            values = df.iloc[:, i]
+            is_null = values.isna()
+            if isinstance(dtype, pd.DatetimeTZDtype):
+                # pyodbc drops tzinfo when binding datetimes, so send the offset in the text instead
+                values = self.datetimeoffset_strings(values)
+            columns.append(values.astype(object).where(~is_null, None).tolist())
+        return list(zip(*columns))
+
+    def parallel_insert_dataframe(self, table_name: str, df: pd.DataFrame, max_workers: int) -> None:
+        """
+        Insert the rows of a dataframe into an existing Quant SQL table using several connections at once.
+        Each connection inserts and commits its own slice of the rows, so if one fails the others' rows are kept.
+        """
+        chunk_rows = math.ceil(len(df) / max_workers)
+        chunks = [df.iloc[i:i + chunk_rows] for i in range(0, len(df), chunk_rows)]
+
+        def insert_chunk(chunk: pd.DataFrame) -> None:
+            conn = self.connect_to_quant_db()
+            try:
+                self.insert_dataframe(conn.cursor(), table_name, chunk)
+                conn.commit()
+            finally:
+                conn.close()
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            list(executor.map(insert_chunk, chunks))
+
+    def bulk_insert_dataframe(self, table_name: str, df: pd.DataFrame) -> None:
+        """
+        Load a dataframe into an existing Quant SQL table using the bcp command line utility.
+        Columns are loaded by position, so the dataframe's columns must be in the same order as the table's.
+        Requires bcp (installed with the SQL Server command line tools) to be on the PATH.
+        bcp commits every 50,000 rows, so unlike the other insert paths a failed load can leave some rows in the table.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_file = os.path.join(tmp_dir, "upload.tsv")
+            self.write_bcp_file(df, data_file)
+
+            command = [
+                "bcp", table_name, "in", data_file,
+                "-S", f"tcp:{self.quant_server_name},1433",
+                "-d", self.quant_db_name,
+                "-G",                   # ActiveDirectoryIntegrated auth, same as connect_to_quant_db
+                "-c", "-t", r"\t",      # Tab separated character data
+                "-C", "65001",          # ...encoded as UTF-8
+                "-b", "50000",          # Rows per committed batch
+                "-m", "1",              # Abort on the first bad row
+                "-h", "TABLOCK"
+            ]
+            result = subprocess.run(command, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"bcp failed to load {table_name}:\n{result.stdout}{result.stderr}")
+
+    def write_bcp_file(self, df: pd.DataFrame, data_file: str) -> None:
+        """
+        Write a dataframe as a tab separated UTF-8 file that bcp can load in character mode.
+        bcp doesn't understand CSV quoting, so values are written as-is and text containing tabs or line breaks is
+        rejected. Nulls are written as empty fields.
+        """
+        columns = {}
+        for i, dtype in enumerate(df.dtypes):
+            values = df.iloc[:, i]
+            if isinstance(dtype, pd.DatetimeTZDtype):
+                values = self.datetimeoffset_strings(values)
+            elif pd.api.types.is_datetime64_any_dtype(dtype):
+                # DATETIME takes at most 3 fractional digits
+                values = values.dt.strftime("%Y-%m-%d %H:%M:%S.%f").str[:-3]
+            elif pd.api.types.is_bool_dtype(dtype):
+                # bcp reads BIT columns as 0/1, not True/False
+                values = values.astype("Int8")
+            elif pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+                values = pd.Series(
+                    [int(value) if isinstance(value, bool) else value for value in values], index=values.index, dtype=object)
+                if values.dropna().astype(str).str.contains(r"[\t\r\n]").any():
+                    raise ValueError(
+                        f"Column '{df.columns[i]}' has values containing tabs or line breaks, which bcp can't load. "
+                        "Upload without use_bulk instead.")
+            columns[i] = values
+        pd.DataFrame(columns).to_csv(
+            data_file, sep="\t", na_rep="", index=False, header=False, quoting=csv.QUOTE_NONE, encoding="utf-8")
+
+    def datetimeoffset_strings(self, values: pd.Series) -> pd.Series:
+        """
+        Format tz-aware datetimes as ISO 8601 strings with their UTC offset (e.g. "2024-01-01 12:00:00.000000+01:00"),
+        which SQL Server reads into DATETIMEOFFSET without losing the offset. Nulls stay null.
+        """
+        text = values.dt.strftime("%Y-%m-%d %H:%M:%S.%f%z")
+        return text.str[:-2] + ":" + text.str[-2:]
+
+    def validate_columns(self, excel_columns: List[str], sql_columns: List[Tuple[str, str, str]]) -> None:
         """
         Check that the Excel file's columns match the SQL table's columns
         in count and name (order-sensitive).
         """
         sql_colnames = [col[0] for col in sql_columns]
+        if excel_columns == sql_colnames:
+            return
 
         if len(excel_columns) != len(sql_colnames):
             raise ValueError(
                 f"Column count mismatch: Excel has {len(excel_columns)}, SQL table has {len(sql_colnames)}")
 
-        mismatched = [i for i in range(len(excel_columns)) if excel_columns[i] != sql_colnames[i]]
-        if mismatched:
-            details = "\n".join(
-                [f"  Position {i+1}: Excel = '{excel_columns[i]}' vs SQL = '{sql_colnames[i]}'" for i in mismatched])
-            raise ValueError(f"Column name mismatch:\n{details}")
+        details = "\n".join(
+            [f"  Position {i+1}: Excel = '{excel_col}' vs SQL = '{sql_col}'"
+             for i, (excel_col, sql_col) in enumerate(zip(excel_columns, sql_colnames)) if excel_col != sql_col])
+        raise ValueError(f"Column name mismatch:\n{details}")
         
+    def disable_nonclustered_indexes(self, cursor: pyodbc.Cursor, table_name: str) -> List[str]:
+        """
+        Disable a table's non-unique nonclustered indexes and return their names.
+        The clustered index and unique indexes are left alone: disabling them would make the table unreadable or stop
+        enforcing uniqueness.
+        """
+        cursor.execute(
+            "SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID(?) AND type = 2 AND is_unique = 0 AND is_disabled = 0",
+            table_name
+        )
+        index_names = [row[0] for row in cursor.fetchall()]
+        for index_name in index_names:
+            cursor.execute(f"ALTER INDEX [{index_name}] ON {table_name} DISABLE")
+        return index_names
+
+    def rebuild_indexes(self, cursor: pyodbc.Cursor, table_name: str, index_names: List[str]) -> None:
+        """
+        Rebuild (and so re-enable) the given indexes on a table.
+        """
+        for index_name in index_names:
+            cursor.execute(f"ALTER INDEX [{index_name}] ON {table_name} REBUILD")
+
+    def sql_type(self, values: pd.Series) -> str:
+        """
+        Pick the SQL type for a new table column from its pandas dtype. Dtypes are classified by kind, so every datetime
+        resolution and the nullable Int/Float/boolean dtypes are covered. Text and anything else is sized by nvarchar_type.
+        """
+        dtype = values.dtype
+        if isinstance(dtype, pd.DatetimeTZDtype):
+            return "DATETIMEOFFSET"
+        if pd.api.types.is_datetime64_dtype(dtype):
+            return "DATETIME"
+        if pd.api.types.is_bool_dtype(dtype):
+            return "BIT"
+        if pd.api.types.is_integer_dtype(dtype):
+            return "INT" if dtype.itemsize <= 4 else "BIGINT"
+        if pd.api.types.is_float_dtype(dtype):
+            return "REAL" if dtype.itemsize <= 4 else "FLOAT"
+        return self.nvarchar_type(values)
+
+    def nvarchar_type(self, values: pd.Series) -> str:
+        """
+        Pick an NVARCHAR width for a text column: 1.5x the longest value, rounded up to a multiple of 50.
+        Falls back to NVARCHAR(100) for empty columns and NVARCHAR(MAX) for anything wider than 4000.
+        """
+        values = values.dropna()
+        if values.empty:
+            return "NVARCHAR(100)"
+        max_len = int(values.astype(str).str.len().max())
+        width = max(50, math.ceil(max_len * 1.5 / 50) * 50)
+        return f"NVARCHAR({width})" if width <= 4000 else "NVARCHAR(MAX)"
+
     def create_table_from_dataframe(self, cursor: pyodbc.Cursor, table_name: str, df: pd.DataFrame, primary_key_columns: List[str] = None) -> None:
-        dtype_mapping = {
-            "object": "NVARCHAR(100)",
-            "int64": "BIGINT",
-            "float64": "FLOAT",
-            "datetime64[ns]": "DATETIME",
-            "bool": "BIT"
-        }
-
-        # Define column names & data types
+        # Define column names & data types. Text (and anything unmapped) is sized from the data
         columns_sql = []
         for col in df.columns:
-            dtype = str(df[col].dtype)
-            sql_type = dtype_mapping.get(dtype, "NVARCHAR(100)")
+            sql_type = self.sql_type(df[col])
+            # Audit columns the data has keep their own type (and nulls) but still get the server default
+            if col in SERVER_DEFAULT_COLUMNS:
+                sql_type += f" DEFAULT {SERVER_DEFAULT_COLUMNS[col][1]}"
             columns_sql.append(f"[{col}] {sql_type}")
+        # Audit columns the data doesn't have are added so the server can fill them in
+        columns_sql += [
+            f"[{col}] {sql_type} NOT NULL DEFAULT {default}"
+            for col, (sql_type, default) in SERVER_DEFAULT_COLUMNS.items() if col not in df.columns]
 
         # If input is used, create primary keys for checking uniqueness and faster indexing
         if primary_key_columns:
@@ -0,0 +1,20 @@
+import os
+import sys
+import types
+
+# Make the Helpers folder importable, the same way the notebooks do
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+# None of the tests touch a database, so where pyodbc can't be loaded (e.g. no ODBC driver manager installed), stand in
+# a module with just the names flp_database_connector uses at import time
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = types.ModuleType("pyodbc")
+    pyodbc.Connection = type("Connection", (), {})
+    pyodbc.Cursor = type("Cursor", (), {})
+    pyodbc.Error = type("Error", (Exception,), {})
+    pyodbc.pooling = True
+    sys.modules.setdefault("pyodbc", pyodbc)
@@ -0,0 +1,327 @@
+import datetime
+import functools
+
+import pandas as pd
+import pyodbc
+import pytest
+
+from Helpers.flp_database_connector import flp_database_connector
+
+
+@pytest.fixture
+def connector():
+    return flp_database_connector("DOMAIN\\tester")
+
+
+# --- bcp data files ---
+def test_write_bcp_file_writes_raw_utf8_values(connector, tmp_path):
+    df = pd.DataFrame({
+        "name": ['say "hi"', "café", None],
+        "flag": [True, False, True],
+        "maybe": [True, None, False],
+        "value": [1.5, None, 3.0],
+    })
+    data_file = tmp_path / "upload.tsv"
+    connector.write_bcp_file(df, str(data_file))
+    assert data_file.read_text(encoding="utf-8").splitlines() == [
+        'say "hi"\t1\t1\t1.5',
+        "café\t0\t\t",
+        "\t1\t0\t3.0",
+    ]
+
+
+def test_write_bcp_file_formats_datetimes(connector, tmp_path):
+    df = pd.DataFrame({
+        "naive": pd.to_datetime(["2024-01-01 12:34:56.789123", None]),
+        "aware": pd.to_datetime(["2024-01-01 12:00:00", None]).tz_localize("America/New_York"),
+    })
+    data_file = tmp_path / "upload.tsv"
+    connector.write_bcp_file(df, str(data_file))
+    assert data_file.read_text(encoding="utf-8").splitlines() == [
+        "2024-01-01 12:34:56.789\t2024-01-01 12:00:00.000000-05:00",
+        "\t",
+    ]
+
+
+@pytest.mark.parametrize("value", ["a\tb", "a\nb", "a\r\nb"])
+def test_write_bcp_file_rejects_tabs_and_line_breaks(connector, tmp_path, value):
+    df = pd.DataFrame({"name": ["ok", value]})
+    with pytest.raises(ValueError, match="'name'"):
+        connector.write_bcp_file(df, str(tmp_path / "upload.tsv"))
+
+
+# --- Excel reading ---
+def write_excel(path, rows):
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    workbook.active.title = "data"
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(path)
+    return str(path)
+
+
+EXCEL_ROWS = [
+    ["id", None, "name", "name", "when"],
+    [1, 10, "a", "x", datetime.datetime(2024, 1, 1)],
+    [2, 20, "b", "y", datetime.datetime(2024, 1, 2)],
+    [3, 30.5, "a much longer name", None, datetime.datetime(2024, 1, 3)],
+]
+
+
+@pytest.fixture
+def excel_file(tmp_path):
+    return write_excel(tmp_path / "upload.xlsx", EXCEL_ROWS)
+
+
+def test_excel_column_names_match_read_excel(connector):
+    assert connector.excel_column_names(["a", None, "a", "a.1", "a", None]) == [
+        "a", "Unnamed: 1", "a.1", "a.1.1", "a.2", "Unnamed: 5"]
+
+
+def test_iter_excel_blocks_skips_empty_rows(connector, tmp_path):
+    excel_file = write_excel(tmp_path / "upload.xlsx", EXCEL_ROWS[:3] + [[None] * 5] + EXCEL_ROWS[3:])
+    blocks = list(connector.iter_excel_blocks(excel_file, block_rows=2))
+    assert [len(block) for block in blocks] == [2, 1]
+    assert blocks[0].columns.tolist() == ["id", "Unnamed: 1", "name", "name.1", "when"]
+    assert blocks[1]["name"].tolist() == ["a much longer name"]
+
+
+@pytest.mark.parametrize("use_calamine", [True, False])
+def test_excel_reading_keeps_an_empty_first_column(connector, tmp_path, monkeypatch, use_calamine):
+    if not use_calamine:
+        monkeypatch.setattr("Helpers.flp_database_connector.CalamineWorkbook", None)
+    excel_file = write_excel(tmp_path / "upload.xlsx", [[None] + row for row in EXCEL_ROWS])
+    blocks = list(connector.iter_excel_blocks(excel_file))
+    schema_df, _ = connector.excel_schema(excel_file)
+    expected = pd.read_excel(excel_file).columns.tolist()
+    assert expected[:2] == ["Unnamed: 0", "id"]
+    assert blocks[0].columns.tolist() == expected
+    assert schema_df.columns.tolist() == expected
+    assert blocks[0]["id"].tolist() == [1, 2, 3]
+
+
+def test_excel_schema_covers_the_whole_sheet(connector, excel_file):
+    schema_df, n_rows = connector.excel_schema(excel_file)
+    expected = pd.read_excel(excel_file)
+    assert n_rows == len(expected)
+    assert schema_df.columns.tolist() == expected.columns.tolist()
+    # The first rows are all ints, but the last one makes the second column float
+    assert schema_df.dtypes.astype(str).tolist() == expected.dtypes.astype(str).tolist()
+    assert connector.nvarchar_type(schema_df["name"]) == connector.nvarchar_type(expected["name"])
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("", None),
+    (3.0, 3),
+    (3.5, 3.5),
+    (datetime.date(2024, 1, 2), datetime.datetime(2024, 1, 2)),
+    ("text", "text"),
+])
+def test_convert_excel_cell(connector, value, expected):
+    result = connector.convert_excel_cell(value)
+    assert result == expected and type(result) is type(expected)
+
+
+# --- Uploads ---
+class FakeCursor:
+    """
+    Stands in for a pyodbc cursor on a connection where every table exists, recording the statements it runs.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+        self.fast_executemany = False
+
+    def execute(self, sql, *params):
+        self.conn.statements.append((sql, params))
+        if sql.startswith(self.conn.refused):
+            raise pyodbc.Error("Permission denied")
+        return self
+
+    def executemany(self, sql, rows):
+        self.conn.statements.append((sql, list(rows)))
+
+    def fetchval(self):
+        return 1
+
+    def fetchall(self):
+        return self.conn.sql_columns
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, sql_columns):
+        self.sql_columns = sql_columns
+        self.refused = ()  # Statement prefixes that fail
+        self.statements = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def test_upload_excel_inserts_every_block_in_one_transaction(connector, excel_file, monkeypatch):
+    sql_columns = [(col, "nvarchar", None) for col in ["id", "Unnamed: 1", "name", "name.1", "when"]]
+    sql_columns += [("update_timestamp", "datetime", "(sysutcdatetime())"), ("update_user", "nvarchar", "(suser_sname())")]
+    conn = FakeConnection(sql_columns)
+    monkeypatch.setattr(connector, "_get_quant_conn", lambda: conn)
+    monkeypatch.setattr(connector, "iter_excel_blocks", functools.partial(connector.iter_excel_blocks, block_rows=2))
+
+    connector.upload_excel_to_quant_db("dbo.MyTable", excel_file, mode="overwrite", skip_prompt=True, check_standards=False)
+
+    inserts = [params[0] for sql, params in conn.statements if sql.startswith("INSERT INTO dbo.MyTable")]
+    assert len(inserts) == 2
+    # Every block is cast to the whole sheet's dtypes, so the second column is float in the first block too
+    assert inserts[0][:5] == [1, 10.0, "a", "x", datetime.datetime(2024, 1, 1)]
+    assert isinstance(inserts[0][1], float)
+    # The truncate and both blocks are committed together
+    assert conn.commits == 1
+
+
+# --- Helpers ---
+def test_dataframe_to_rows_sends_nulls_as_none(connector):
+    df = pd.DataFrame({
+        "i": pd.array([1, None], dtype="Int64"),
+        "f": [1.5, float("nan")],
+        "s": ["a", None],
+        "b": [True, False],
+        "d": pd.to_datetime(["2024-01-01 12:00", None]),
+    })
+    rows = connector.dataframe_to_rows(df)
+    assert rows == [(1, 1.5, "a", True, datetime.datetime(2024, 1, 1, 12)), (None, None, None, False, None)]
+
+
+def test_dataframe_to_rows_keeps_utc_offsets(connector):
+    df = pd.DataFrame({"d": pd.to_datetime(["2024-07-01 12:00:00.5", None]).tz_localize("America/New_York")})
+    assert connector.dataframe_to_rows(df) == [("2024-07-01 12:00:00.500000-04:00",), (None,)]
+
+
+@pytest.mark.parametrize("values, expected", [
+    ([None, None], "NVARCHAR(100)"),
+    (["a", "abc"], "NVARCHAR(50)"),
+    (["x" * 40], "NVARCHAR(100)"),
+    (["x" * 3000], "NVARCHAR(MAX)"),
+])
+def test_nvarchar_type(connector, values, expected):
+    assert connector.nvarchar_type(pd.Series(values, dtype=object)) == expected
+
+
+def test_validate_columns(connector):
+    sql_columns = [("a", "int", None), ("b", "nvarchar", None)]
+    connector.validate_columns(["a", "b"], sql_columns)
+    with pytest.raises(ValueError, match="count mismatch"):
+        connector.validate_columns(["a"], sql_columns)
+    with pytest.raises(ValueError, match="Position 2: Excel = 'c' vs SQL = 'b'"):
+        connector.validate_columns(["a", "c"], sql_columns)
+
+
+def test_merge_staging_table_sql(connector):
+    conn = FakeConnection([])
+    connector.merge_staging_table(
+        conn.cursor(), "##staging", "ops.MyTable", ["k", "v"], ["k"], default_columns=["update_timestamp"])
+    assert conn.statements == [(
+        "MERGE INTO ops.MyTable WITH (HOLDLOCK) AS tgt USING ##staging AS src ON tgt.[k] = src.[k] "
+        "WHEN MATCHED THEN UPDATE SET tgt.[v] = src.[v], [update_timestamp] = DEFAULT "
+        "WHEN NOT MATCHED THEN INSERT ([k], [v]) VALUES (src.[k], src.[v]);", ())]
+
+
+def test_merge_staging_table_with_only_key_columns_skips_update(connector):
+    conn = FakeConnection([])
+    connector.merge_staging_table(conn.cursor(), "##staging", "ops.MyTable", ["k"], ["k"])
+    assert "WHEN MATCHED" not in conn.statements[0][0]
+
+
+def test_upload_fills_audit_columns_without_server_defaults(connector, monkeypatch):
+    sql_columns = [("k", "int", None), ("update_timestamp", "datetime", None), ("update_user", "nvarchar", None)]
+    conn = FakeConnection(sql_columns)
+    monkeypatch.setattr(connector, "_get_quant_conn", lambda: conn)
+    before = datetime.datetime.now()
+
+    connector.upload_data_to_quant_db("dbo.MyTable", pd.DataFrame({"k": [1]}), check_standards=False)
+
+    insert = [params[0] for sql, params in conn.statements if sql.startswith("INSERT INTO dbo.MyTable")][0]
+    # Older tables keep their convention: local time and the username without its domain
+    assert insert[0] == 1
+    assert before <= insert[1] <= datetime.datetime.now()
+    assert insert[2] == "tester"
+
+
+def test_create_table_keeps_supplied_audit_columns_nullable(connector):
+    conn = FakeConnection([])
+    df = pd.DataFrame({"k": [1, 2], "update_user": ["me", None]})
+    connector.create_table_from_dataframe(conn.cursor(), "dbo.MyTable", df, primary_key_columns=["k"])
+    assert conn.statements[0][0] == (
+        "CREATE TABLE dbo.MyTable ([k] BIGINT, [update_user] NVARCHAR(50) DEFAULT SUSER_SNAME(), "
+        "[update_timestamp] DATETIME NOT NULL DEFAULT SYSUTCDATETIME(), PRIMARY KEY ([k]))")
+
+
+def test_upload_keeps_small_blocks_off_the_cached_insert_cursor(connector, monkeypatch):
+    sql_columns = [("k", "int", None), ("v", "int", None)]
+    sql_columns += [("update_timestamp", "datetime", "(sysutcdatetime())"), ("update_user", "nvarchar", "(suser_sname())")]
+    conn = FakeConnection(sql_columns)
+    monkeypatch.setattr(connector, "_get_quant_conn", lambda: conn)
+    cached_cursor = connector._get_insert_cursor(conn, "dbo.MyTable", ["k", "v"])
+
+    big, small = pd.DataFrame({"k": range(600), "v": range(600)}), pd.DataFrame({"k": [1], "v": [1]})
+    statements = []
+    monkeypatch.setattr(connector, "insert_dataframe", lambda cursor, table, block: statements.append((cursor, len(block))))
+    connector._upload_to_quant_db("dbo.MyTable", big, 601, [big, small], "append", True, False)
+
+    # Only the block sent with executemany goes through the cached cursor
+    assert statements[0] == (cached_cursor, 600)
+    assert statements[1][0] is not cached_cursor
+
+
+@pytest.mark.parametrize("values, expected", [
+    (pd.to_datetime([0, 60], unit="s"), "DATETIME"),
+    (pd.to_datetime(["2024-01-01"]).as_unit("ms"), "DATETIME"),
+    (pd.to_datetime(["2024-01-01"]).tz_localize("UTC"), "DATETIMEOFFSET"),
+    (pd.array([1, None], dtype="Int64"), "BIGINT"),
+    (pd.array([1, None], dtype="Int32"), "INT"),
+    (pd.array([1, 2], dtype="int32"), "INT"),
+    (pd.array([1.5, None], dtype="Float64"), "FLOAT"),
+    (pd.array([1.5], dtype="float32"), "REAL"),
+    (pd.array([True, None], dtype="boolean"), "BIT"),
+    (pd.array([True, False], dtype="bool"), "BIT"),
+    (pd.array(["a", None], dtype=object), "NVARCHAR(50)"),
+])
+def test_sql_type(connector, values, expected):
+    assert connector.sql_type(pd.Series(values)) == expected
+
+
+def test_overwrite_falls_back_to_delete_when_truncate_is_refused(connector, monkeypatch):
+    conn = FakeConnection([("k", "int", None), ("update_timestamp", "datetime", "(sysutcdatetime())"),
+                           ("update_user", "nvarchar", "(suser_sname())")])
+    conn.refused = ("TRUNCATE",)
+    monkeypatch.setattr(connector, "_get_quant_conn", lambda: conn)
+    connector.upload_data_to_quant_db("dbo.MyTable", pd.DataFrame({"k": [1]}), "overwrite", True, False)
+    assert "DELETE FROM dbo.MyTable" in [sql for sql, params in conn.statements]
+
+
+@pytest.mark.parametrize("use_bulk, rebuilt", [(False, False), (True, True)])
+def test_failed_overwrite_only_rebuilds_indexes_whose_disable_was_committed(connector, monkeypatch, use_bulk, rebuilt):
+    conn = FakeConnection([("k", "int", None), ("update_timestamp", "datetime", "(sysutcdatetime())"),
+                           ("update_user", "nvarchar", "(suser_sname())")])
+    monkeypatch.setattr(connector, "_get_quant_conn", lambda: conn)
+    monkeypatch.setattr(connector, "disable_nonclustered_indexes", lambda cursor, table: ["ix_k"])
+    rebuilds = []
+    monkeypatch.setattr(connector, "rebuild_indexes", lambda cursor, table, names: rebuilds.append(names))
+
+    def fail(*args):
+        raise RuntimeError("load failed")
+    monkeypatch.setattr(connector, "insert_dataframe", fail)
+    monkeypatch.setattr(connector, "bulk_insert_dataframe", fail)
+
+    df = pd.DataFrame({"k": [1]})
+    with pytest.raises(RuntimeError, match="load failed"):
+        connector._upload_to_quant_db("dbo.MyTable", df, 600_000, [df], "overwrite", True, False, use_bulk=use_bulk)
+    assert rebuilds == ([["ix_k"]] if rebuilt else [])